@@ -0,0 +1,233 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import slim_scraper
+from slim_scraper import (
+    create_db,
+    check_db,
+    configure_session,
+    print_request_stats,
+    iter_mit_repos,
+    get_languages,
+    list_prs,
+    get_merged_prs_page,
+    get_pr_files_page,
+    pr_file_rows,
+    FIXED_ISSUES_INSERT,
+    PR_FILES_INSERT,
+    pair_prs_with_issues,
+    fixed_issue_rows,
+    should_scrape,
+    mark_scraped,
+    get_watermark,
+    set_watermark,
+)
+from db_writer import DbWriter
+from db_profile import DB_PATH, connect
+
+# asyncio version of populate_db_from_prs. the blocking request helpers run on a
+# thread pool and the event loop just decides how many are in flight at once,
+# so whatever make_request does (retries, rate limits) applies here too.
+# writes are queued to a DbWriter in the same PR order as the sync path,
+# so both produce the same fixed_issues rows and can be benchmarked against each other
+
+MAX_IN_FLIGHT = 16  # requests in flight overall
+PER_REPO_IN_FLIGHT = 4  # requests in flight for any one repo
+MAX_REPOS_IN_FLIGHT = 32  # repos being worked on at once, keeps memory flat when streaming
+
+
+class _Limiter:
+    """overall + per repo caps on in-flight requests"""
+
+    def __init__(self, executor, max_in_flight, per_repo):
+        self.executor = executor
+        self.overall = asyncio.Semaphore(max_in_flight)
+        self.per_repo = per_repo
+        self.repo_sems = {}
+
+    async def run(self, repo_name, fn, *args):
+        repo_sem = self.repo_sems.setdefault(repo_name, asyncio.Semaphore(self.per_repo))
+        async with repo_sem, self.overall:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+
+
+async def get_merged_prs_async(limiter, repo_name, per_page=30, pages=3):
+    """
+    all PR list pages at once, a failed page raises FetchError like the sync listing.
+    pages=None (backfill) gets page 1 first for rel="last", then the rest at once.
+    every page is its own limiter slot, so the in-flight caps hold
+    """
+    if pages is None:
+        first, last = await limiter.run(repo_name, get_merged_prs_page, repo_name, 1, per_page)
+        page_numbers = range(2, last + 1)
+    else:
+        first, page_numbers = [], range(1, pages + 1)
+    results = await asyncio.gather(
+        *(limiter.run(repo_name, get_merged_prs_page, repo_name, page, per_page) for page in page_numbers)
+    )
+    return first + [pr for merged_prs, _ in results for pr in merged_prs]
+
+
+async def get_pr_files_async(limiter, repo_name, pr_url):
+    """get_pr_files with page 1 then the rest going through the limiter, instead of
+    get_pr_files' own thread pool running uncounted inside one slot"""
+    files, last = await limiter.run(repo_name, get_pr_files_page, pr_url, 1)
+    rest = await asyncio.gather(
+        *(limiter.run(repo_name, get_pr_files_page, pr_url, page) for page in range(2, last + 1))
+    )
+    for more, _ in rest:
+        files.extend(more)
+    return files
+
+
+async def process_repo_async(
+    limiter,
+    cursor,
+    writer,
+    repo,
+    skip_unchanged=True,
+    incremental=True,
+    discovery="pulls",
+    linking="body",
+    backfill=False,
+    pages=3,
+):
+    repo_name = repo["full_name"]
+    if not should_scrape(cursor, repo, skip_unchanged, writer):
+        return 0
+
+    since = get_watermark(cursor, repo_name) if incremental else None
+    if since or discovery != "pulls":
+        # paging has to stop at the watermark, so pages go one after another
+        pr_listing = limiter.run(repo_name, list_prs, repo_name, discovery, pages, since, False, linking)
+    elif backfill:
+        pr_listing = get_merged_prs_async(limiter, repo_name, per_page=100, pages=pages)
+    else:
+        pr_listing = get_merged_prs_async(limiter, repo_name, pages=pages)
+    languages, prs = await asyncio.gather(limiter.run(repo_name, get_languages, repo_name), pr_listing)
+    if not prs:
+        print(f"no PRs found for {repo_name}, skipping it")
+        writer.call(mark_scraped, repo)
+        return 0
+
+    if linking == "body":
+        linked = pair_prs_with_issues(repo_name, prs)
+    else:
+        # the events stream means network calls, so off the loop
+        linked = await limiter.run(repo_name, pair_prs_with_issues, repo_name, prs, linking, since)
+
+    files = await asyncio.gather(*(get_pr_files_async(limiter, repo_name, pr["html_url"]) for pr, _ in linked))
+
+    queued = 0
+    for (pr, issues), pr_files in zip(linked, files):
+        affected_files = json.dumps([file["filename"] for file in pr_files])
+        rows = fixed_issue_rows(pr, repo_name, issues, languages, affected_files)
+        writer.executemany(FIXED_ISSUES_INSERT, rows, label="fixed_issues")
+        writer.executemany(PR_FILES_INSERT, pr_file_rows(pr["html_url"], pr_files))
+        queued += len(rows)
+    writer.call(mark_scraped, repo)
+    writer.call(set_watermark, repo_name, prs)
+    print(f"{queued} entries for {repo_name} queued ({len(prs)} PRs, {len(linked)} with linked issues)")
+    return queued
+
+
+async def aiter_repos(repos):
+    """async iterator over a list, a generator like iter_mit_repos, or an async iterator"""
+    if hasattr(repos, "__aiter__"):
+        async for repo in repos:
+            yield repo
+        return
+    if isinstance(repos, (list, tuple)):
+        for repo in repos:
+            yield repo
+        return
+    # a blocking generator, pull from it off the loop so pages can land while we work
+    loop = asyncio.get_running_loop()
+    it = iter(repos)
+    done = object()
+    while True:
+        repo = await loop.run_in_executor(None, next, it, done)
+        if repo is done:
+            return
+        yield repo
+
+
+def _report_failures(tasks):
+    """a repo that blew up gets logged and skipped (it isn't marked scraped, so it's retried next run)"""
+    for task in tasks:
+        error = task.exception()
+        if error is not None:
+            print(f"failed on {task.get_name()}: {error.__class__.__name__}: {error}")
+
+
+async def populate_db_from_prs_async(
+    repos,
+    max_in_flight=MAX_IN_FLIGHT,
+    per_repo=PER_REPO_IN_FLIGHT,
+    max_repos=MAX_REPOS_IN_FLIGHT,
+    skip_unchanged=True,
+    pages=3,
+    incremental=True,
+    discovery="pulls",
+    linking="body",
+    backfill=False,
+):
+    """same rows as populate_db_from_prs, but with requests running concurrently.
+    repos can be a list or a stream (iter_mit_repos), repos start as they arrive.
+    pages/incremental/backfill work like they do for populate_db_from_prs"""
+    conn = connect()
+    cursor = conn.cursor()  # reads only
+    # writes go to their own thread, so the event loop never waits on disk
+    writer = DbWriter(DB_PATH)
+
+    # keep-alive pool needs a slot per in-flight request or the extras get thrown away
+    if max_in_flight > slim_scraper.POOL_SIZE:
+        configure_session(pool_size=max_in_flight)
+
+    def one(limiter, repo):
+        return process_repo_async(
+            limiter, cursor, writer, repo, skip_unchanged, incremental, discovery, linking, backfill, pages
+        )
+
+    try:
+        await _run_repos(repos, max_in_flight, per_repo, max_repos, one)
+    finally:
+        # Ctrl-C (the task gets cancelled) included, whatever's queued still gets committed
+        conn.close()
+        writer.close()
+    return writer.changed.get("fixed_issues", 0)
+
+
+async def _run_repos(repos, max_in_flight, per_repo, max_repos, one):
+    """one(limiter, repo) for every repo, at most max_repos at a time"""
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        limiter = _Limiter(executor, max_in_flight, per_repo)
+        active = set()
+        async for repo in aiter_repos(repos):
+            if len(active) >= max_repos:
+                done, active = await asyncio.wait(active, return_when=asyncio.FIRST_COMPLETED)
+                _report_failures(done)
+            active.add(asyncio.create_task(one(limiter, repo), name=repo["full_name"]))
+        if active:
+            done, _ = await asyncio.wait(active)
+            _report_failures(done)
+
+
+if __name__ == "__main__":
+    print("starting (async)...")
+
+    create_db()
+
+    start = time.time()
+    repos = iter_mit_repos(query="stars:>50000", per_page=100, pages=10)
+    count = asyncio.run(populate_db_from_prs_async(repos))
+    print(f"\n {count} issue-PR pairs added to .db in {time.time() - start:.1f}s")
+
+    check_db()
+
+    print_request_stats()
+
+    print("\n done! \n")
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+# PRAGMA sets for the fixed_issues db, every connection goes through connect()
+# so they all get the same one (pragmas other than journal_mode are per connection).
+#   "wal"     - just journal_mode=WAL, what create_db used to do, kept for comparison
+#   "default" - long running scrapes. synchronous=NORMAL only fsyncs on checkpoint,
+#               so a crash can lose the last few commits but can't corrupt anything
+#               (and the watermark/pushed_at bookkeeping means they get redone)
+#   "bulk"    - backfills that can just be rerun if they die. no fsyncs, bigger cache,
+#               no autocheckpoint (one TRUNCATE at the end instead), and bulk_load()
+#               drops the secondary indexes for the load and builds them once after
+# pick one with GH_DB_PROFILE, or profile= where a tool opens its connection.
+# "bulk" is only for profile= on a connection used inside bulk_load(), nothing else
+# checkpoints with autocheckpoint off so the -wal file would just keep growing
+
+DB_PATH = "fixed_issues.db"
+DB_PROFILE = os.getenv("GH_DB_PROFILE", "default")
+
+PROFILES = {
+    "wal": {
+        "journal_mode": "WAL",
+    },
+    "default": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,  # negative = KiB, so ~64MB
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 1000,  # pages, sqlite's own default made explicit
+    },
+    "bulk": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -256000,
+        "mmap_size": 1024 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 0,
+    },
+}
+
+
+def apply_profile(conn, profile=None):
+    if profile is None and DB_PROFILE == "bulk":
+        raise ValueError("GH_DB_PROFILE=bulk isn't allowed, scraper connections never checkpoint. "
+                         "bulk is only for bulk loads (gharchive.py already uses it)")
+    profile = profile or DB_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"unknown db profile {profile!r}, pick one of {', '.join(PROFILES)}")
+    for pragma, value in PROFILES[profile].items():
+        conn.execute(f"PRAGMA {pragma}={value};")
+    return conn
+
+
+def connect(path=DB_PATH, profile=None, **kwargs):
+    """sqlite3.connect with the profile's pragmas applied"""
+    return apply_profile(sqlite3.connect(path, **kwargs), profile)
+
+
+def checkpoint(conn, mode="PASSIVE"):
+    """fold the WAL back into the db, TRUNCATE also resets the -wal file to 0 bytes.
+    returns (busy, wal pages, pages checkpointed)"""
+    return conn.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+
+
+@contextmanager
+def bulk_load(conn, indexes):
+    """drop the secondary indexes ({name: create sql}) for the load, rebuild them after"""
+    for name in indexes:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+    try:
+        yield conn
+    finally:
+        for sql in indexes.values():
+            conn.execute(sql)
+        conn.commit()
+        checkpoint(conn, "TRUNCATE")
+
+
+def benchmark(profiles=None, rows=200_000, batch=500):
+    """rows/s for each profile, fixed_issues shaped rows committed batch at a time
+    (like DbWriter does), index rebuild and final checkpoint included"""
+    from fixed_issues import create_db, FIXED_ISSUES_INSERT, FIXED_ISSUES_INDEXES
+
+    data = [
+        (
+            f"https://github.com/o/r{i % 500}/issues/{i}",
+            f"o/r{i % 500}",
+            f"https://github.com/o/r{i % 500}/pull/{i}",
+            '["Python", "C"]',
+            f"https://github.com/o/r{i % 500}/commit/{i:040x}",
+            f"https://github.com/o/r{i % 500}/commit/{i + 1:040x}",
+            '["src/a.py", "src/b.py", "tests/test_a.py"]',
+        )
+        for i in range(rows)
+    ]
+    results = {}
+    for profile in profiles or PROFILES:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            create_db(path, profile)
+            conn = connect(path, profile)
+            start = time.time()
+            with bulk_load(conn, FIXED_ISSUES_INDEXES) if profile == "bulk" else conn:
+                for i in range(0, rows, batch):
+                    conn.executemany(FIXED_ISSUES_INSERT, data[i : i + batch])
+                    conn.commit()
+            if profile != "bulk":
+                checkpoint(conn, "TRUNCATE")
+            elapsed = time.time() - start
+            conn.close()
+        results[profile] = rows / elapsed
+        print(f"  {profile}: {rows} rows in {elapsed:.2f}s, {results[profile]:,.0f} rows/s")
+    return results
+
+
+if __name__ == "__main__":
+    print("benchmarking db profiles...")
+    benchmark()
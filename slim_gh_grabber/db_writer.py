@@ -0,0 +1,173 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from db_profile import DB_PATH, connect
+
+# one thread owns the sqlite connection and does every write. fetchers hand it
+# rows through a bounded queue and go straight back to the network, the writer
+# saves up rows per statement, runs each lot as one executemany and
+# commits every commit_rows rows or commit_interval seconds, whichever's first.
+# a full queue blocks the producers, that's the backpressure if disk falls behind.
+# errors on the writer thread get printed and it carries on, if it dies anyway
+# (couldn't even open the db) the next executemany/call/flush/close raises it
+# instead of waiting on a queue nobody reads
+
+
+class _Flush:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class DbWriter:
+    def __init__(self, path=DB_PATH, max_queue=1000, commit_rows=500, commit_interval=2.0, profile=None):
+        self.path = path
+        self.profile = profile
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.commit_rows = commit_rows
+        self.commit_interval = commit_interval
+        self.changed = {}  # label -> rows actually inserted/updated
+        self.rows = 0
+        self.commits = 0
+        self.error = None  # whatever killed the writer thread
+        self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self.thread.start()
+
+    def executemany(self, sql, rows, label=None):
+        """queue rows for sql, label = what to count the changes under"""
+        if rows:
+            self._put(("many", sql, list(rows), label))
+
+    def call(self, fn, *args):
+        """run fn(cursor, *args) on the writer thread, in queue order"""
+        self._put(("call", fn, args, None))
+
+    def flush(self):
+        """block until everything queued so far is committed"""
+        marker = _Flush()
+        self._put(("flush", marker, None, None))
+        while not marker.done.wait(0.5):
+            self._check()
+
+    def close(self):
+        if self.thread.is_alive():
+            self._put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"db writer died: {self.error!r}") from self.error
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError(f"db writer died: {self.error!r}") from self.error
+        if not self.thread.is_alive():
+            raise RuntimeError("db writer is closed")
+
+    def _put(self, item):
+        # a dead writer never empties the queue, so don't block on it forever
+        while True:
+            self._check()
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    def _run(self):
+        try:
+            self._loop()
+        except BaseException as e:
+            self.error = e
+            print(f".db writer died: {e!r}")
+
+    def _loop(self):
+        conn = connect(self.path, self.profile)
+        cursor = conn.cursor()
+        pending = 0  # rows written since the last commit
+        first_write = None
+        batches = {}  # (sql, label) -> rows waiting for their executemany
+
+        def write_batch():
+            # anything queued before a call has to land before it runs
+            for (sql, label), rows in batches.items():
+                self._executemany(cursor, sql, rows, label)
+            batches.clear()
+
+        def commit():
+            nonlocal pending, first_write
+            try:
+                write_batch()
+                if first_write is not None:
+                    conn.commit()
+                    self.commits += 1
+            except Exception as e:
+                # e.g. locked by another process writing the same file, the rows are
+                # still in the open transaction so just try again after the interval
+                print(f".db error: {e} on commit, retrying")
+                if first_write is not None:
+                    first_write = time.time()
+                return False
+            pending = 0
+            first_write = None
+            return True
+
+        while True:
+            timeout = None
+            if first_write is not None:
+                timeout = max(0, first_write + self.commit_interval - time.time())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                commit()
+                continue
+            if item is None:
+                for _ in range(3):
+                    if commit():
+                        break
+                    time.sleep(self.commit_interval)
+                else:
+                    print(f".db error: closing with {pending} uncommitted rows, they're lost")
+                break
+
+            kind, target, args, label = item
+            if kind == "many":
+                batches.setdefault((target, label), []).extend(args)
+                pending += len(args)
+                self.rows += len(args)
+            elif kind == "call":
+                try:
+                    write_batch()
+                    target(cursor, *args)
+                except Exception as e:
+                    print(f".db error: {e!r} in {getattr(target, '__name__', target)}")
+                pending += 1
+            else:
+                commit()
+                target.done.set()
+                continue
+
+            if first_write is None:
+                first_write = time.time()
+            if pending >= self.commit_rows or time.time() - first_write >= self.commit_interval:
+                commit()
+
+        conn.close()
+
+    def _executemany(self, cursor, sql, rows, label):
+        try:
+            cursor.executemany(sql, rows)
+            changed = cursor.rowcount
+        except Exception:
+            # one bad row shouldn't lose the rest of the batch
+            changed = 0
+            for row in rows:
+                try:
+                    cursor.execute(sql, row)
+                    changed += max(cursor.rowcount, 0)
+                except Exception as e:
+                    print(f".db error: {e} for row {row[0]}")
+        if label:
+            self.changed[label] = self.changed.get(label, 0) + changed
+
+    def stats(self):
+        return {"rows": self.rows, "commits": self.commits, "changed": dict(self.changed)}
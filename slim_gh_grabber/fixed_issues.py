@@ -0,0 +1,168 @@
+import re
+import sqlite3
+
+from db_profile import DB_PATH, connect
+
+# the fixed_issues db itself: schema, the rows that go in it, and pulling the
+# linked issues out of a PR. nothing in here touches the network, so offline
+# tools (gharchive.py, db_profile.py's benchmark) can use it without a token
+
+# secondary indexes, dropped and rebuilt around bulk loads (db_profile.bulk_load)
+FIXED_ISSUES_INDEXES = {
+    "idx_fixed_issues_repo": "CREATE INDEX IF NOT EXISTS idx_fixed_issues_repo ON fixed_issues (repo_name)",
+}
+
+def create_db(path=DB_PATH, profile=None):
+    conn = connect(path, profile)
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fixed_issues (
+            issue_url TEXT PRIMARY KEY,
+            repo_name TEXT,
+            pull_request_url TEXT,
+            languages TEXT,
+            before_code_url TEXT,
+            after_code_url TEXT,
+            affected_files TEXT
+        )
+    """)
+    # what the search payload told us about each repo, and the pushed_at it had
+    # the last time we scraped it, so unchanged repos can be skipped outright
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS repos (
+            full_name TEXT PRIMARY KEY,
+            stars INTEGER,
+            language TEXT,
+            pushed_at TEXT,
+            default_branch TEXT,
+            scraped_pushed_at TEXT,
+            last_scraped_at TEXT,
+            pr_watermark TEXT
+        )
+    """)
+    _add_column(cursor, "repos", "pr_watermark", "TEXT")
+    # one row per file a fixed_issues PR touched, with what the files endpoint
+    # says about it (fixed_issues.affected_files only has the names)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pr_files (
+            pull_request_url TEXT,
+            filename TEXT,
+            status TEXT,
+            additions INTEGER,
+            deletions INTEGER,
+            changes INTEGER,
+            sha TEXT,
+            PRIMARY KEY (pull_request_url, filename)
+        )
+    """)
+    for sql in FIXED_ISSUES_INDEXES.values():
+        cursor.execute(sql)
+    conn.commit()
+    conn.close()
+
+def _add_column(cursor, table, column, kind):
+    """for dbs made before the column existed"""
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+def get_issues_from_pr(pr_data, repo_name):
+    """get linked issues from a pull request"""
+    # Check PR body for issue references
+    body = pr_data.get("body", "")
+    if not body:
+        return []
+    
+    # common issue reference patterns
+    linked_issues = []
+    
+    # pattern: "fixes #123", "closes #123", etc.
+    patterns = [
+        r'(?:close[sd]?|fix(?:e[sd])?|resolve[sd]?)\s+#(\d+)',
+        r'(?:close[sd]?|fix(?:e[sd])?|resolve[sd]?)\s+' + repo_name.replace('/', '\/') + r'#(\d+)'
+    ]
+    
+    for pattern in patterns:
+        matches = re.findall(pattern, body, re.IGNORECASE)
+        for issue_num in matches:
+            issue_url = f"https://github.com/{repo_name}/issues/{issue_num}"
+            linked_issues.append(issue_url)
+    
+    return linked_issues
+
+def fixed_issue_rows(pr, repo_name, linked_issues, languages, affected_files):
+    """fixed_issues rows for one PR, one per linked issue"""
+    # get before/after code URLs
+    base_sha = pr.get("base", {}).get("sha")
+    head_sha = pr.get("head", {}).get("sha")
+    before_code_url = f"https://github.com/{repo_name}/commit/{base_sha}" if base_sha else None
+    after_code_url = f"https://github.com/{repo_name}/commit/{head_sha}" if head_sha else None
+    return [
+        (issue_url, repo_name, pr["html_url"], languages, before_code_url, after_code_url, affected_files)
+        for issue_url in linked_issues
+    ]
+
+# first PR to claim an issue keeps it. the one exception is a row that came in
+# with gaps (gharchive has no languages or file list): when the same PR turns up
+# again with them, the NULLs get filled in
+FIXED_ISSUES_INSERT = """
+    INSERT INTO fixed_issues VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(issue_url) DO UPDATE SET
+        languages = COALESCE(fixed_issues.languages, excluded.languages),
+        before_code_url = COALESCE(fixed_issues.before_code_url, excluded.before_code_url),
+        after_code_url = COALESCE(fixed_issues.after_code_url, excluded.after_code_url),
+        affected_files = COALESCE(fixed_issues.affected_files, excluded.affected_files)
+    WHERE fixed_issues.pull_request_url = excluded.pull_request_url AND (
+        (fixed_issues.languages IS NULL AND excluded.languages IS NOT NULL)
+        OR (fixed_issues.affected_files IS NULL AND excluded.affected_files IS NOT NULL)
+    )
+"""
+PR_FILES_INSERT = "INSERT OR REPLACE INTO pr_files VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+def insert_fixed_issues(cursor, rows):
+    """insert each row (or fill in its gaps), returns how many were actually added/filled"""
+    added = 0
+    for row in rows:
+        try:
+            cursor.execute(FIXED_ISSUES_INSERT, row)
+            if cursor.rowcount > 0:
+                added += 1
+        except sqlite3.Error as e:
+            print(f".db error: {e} for issue {row[0]}")
+    return added
+
+def check_db():
+    """Check database contents and print summary stats"""
+    conn = connect()
+    cursor = conn.cursor()
+    
+    # get total count
+    cursor.execute("SELECT COUNT(*) FROM fixed_issues")
+    count = cursor.fetchone()[0]
+    print(f"\n .db contains {count} total entries")
+    
+    if count > 0:
+        # repos with most entries, figure more is better than less
+        cursor.execute("""
+            SELECT repo_name, COUNT(*) as count 
+            FROM fixed_issues 
+            GROUP BY repo_name 
+            ORDER BY count DESC 
+            LIMIT 5
+        """)
+        print("\ntop repos (by entries):")
+        for repo, entries in cursor.fetchall():
+            print(f"  {repo}: {entries} entries")
+        
+        # sample entries for terminal
+        cursor.execute("SELECT * FROM fixed_issues LIMIT 3")
+        print("\nSample entries:")
+        for row in cursor.fetchall():
+            print(f"  Issue: {row[0]}")
+            print(f"  Repo: {row[1]}")
+            print(f"  PR: {row[2]}")
+            print(f"  Languages: {row[3]}")
+            print(f"  Files: {row[6]}")
+            print()
+    
+    conn.close()
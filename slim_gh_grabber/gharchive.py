@@ -0,0 +1,129 @@
+import glob
+import gzip
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fixed_issues import (
+    create_db,
+    check_db,
+    get_issues_from_pr,
+    fixed_issue_rows,
+    insert_fixed_issues,
+    FIXED_ISSUES_INDEXES,
+)
+from db_profile import bulk_load, connect
+
+# offline backfill from GH Archive (https://www.gharchive.org/) hourly dumps,
+# e.g. 2024-01-01-15.json.gz, already downloaded to local disk. every merged PR
+# for the repos we care about is in there with its body, so the issue links come
+# straight out of get_issues_from_pr without spending any API budget (or
+# needing a token, nothing here imports slim_scraper).
+# each file is read as a stream in its own process, the parent does all the
+# inserting so sqlite only ever has one writer.
+# runs with the "bulk" db profile, see db_profile.py.
+# the archive doesn't have the changed file list or repo languages in it, so
+# both are left NULL. FIXED_ISSUES_INSERT fills them in if the REST/graphql
+# scrapers later come across the same PR, which only happens for PRs inside
+# what they list (pages / since the watermark), older ones stay NULL
+
+WORKERS = None  # None = one per cpu
+
+_repos = None  # set in each worker by _init
+
+
+def _init(repos):
+    global _repos
+    _repos = repos
+
+
+def merged_prs_in_file(path, repos=None):
+    """yields (repo name, pull_request) for every merged PR closed in one hourly file"""
+    repos = repos if repos is not None else _repos
+    with gzip.open(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            # cheap check before paying for json.loads, most of the file is pushes/watches
+            if '"PullRequestEvent"' not in line:
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if event.get("type") != "PullRequestEvent":
+                continue
+            repo_name = (event.get("repo") or {}).get("name")
+            if repos and repo_name not in repos:
+                continue
+            payload = event.get("payload") or {}
+            pr = payload.get("pull_request") or {}
+            if payload.get("action") == "closed" and pr.get("merged"):
+                yield repo_name, pr
+
+
+def rows_from_file(path):
+    """fixed_issues rows (no languages or files) for one file, runs in a worker"""
+    rows = []
+    prs = 0
+    try:
+        for repo_name, pr in merged_prs_in_file(path):
+            prs += 1
+            linked_issues = get_issues_from_pr(pr, repo_name)
+            if linked_issues:
+                rows.extend(fixed_issue_rows(pr, repo_name, linked_issues, None, None))
+    except (OSError, EOFError) as e:
+        # truncated downloads are common, keep whatever came before the break
+        print(f"error reading {path}: {e}")
+    return path, prs, rows
+
+
+def repos_of_interest(cursor):
+    """every repo in the repos table"""
+    return {name for (name,) in cursor.execute("SELECT full_name FROM repos")}
+
+
+def ingest_archive(paths, repos=None, workers=WORKERS):
+    """
+    parse the hourly files in parallel and insert the rows. repos = the repo names
+    to keep (defaults to the repos table, empty = every repo in the archive)
+    """
+    create_db()
+    conn = connect(profile="bulk")
+    cursor = conn.cursor()
+    repos = set(repos) if repos is not None else repos_of_interest(cursor)
+    if not repos:
+        print("no repos to filter on, keeping every merged PR in the archive")
+
+    total_added = 0
+    total_prs = 0
+    with bulk_load(conn, FIXED_ISSUES_INDEXES), ProcessPoolExecutor(
+        max_workers=workers, initializer=_init, initargs=(repos,)
+    ) as executor:
+        for path, prs, rows in executor.map(rows_from_file, paths):
+            added = insert_fixed_issues(cursor, rows)
+            conn.commit()
+            total_prs += prs
+            total_added += added
+            print(f"{path}: {prs} merged PRs, {added} entries added")
+
+    conn.close()
+    print(f"\n {total_prs} merged PRs across {len(paths)} files")
+    return total_added
+
+
+if __name__ == "__main__":
+    # python gharchive.py 'archive/2024-01-*.json.gz' [owner/repo ...]
+    if len(sys.argv) < 2:
+        print("usage: python gharchive.py '<glob of .json.gz files>' [owner/repo ...]")
+        sys.exit(1)
+
+    paths = sorted(glob.glob(sys.argv[1]))
+    print(f"starting (gh archive, {len(paths)} files)...")
+
+    start = time.time()
+    count = ingest_archive(paths, repos=sys.argv[2:] or None)
+    print(f"\n {count} issue-PR pairs added to .db in {time.time() - start:.1f}s")
+
+    check_db()
+
+    print("\n done! \n")
@@ -0,0 +1,281 @@
+import json
+import time
+from collections import deque
+from functools import lru_cache
+
+from slim_scraper import (
+    create_db,
+    check_db,
+    iter_mit_repos,
+    get_affected_files,
+    FetchError,
+    get_issues_from_pr,
+    graphql_request,
+    insert_fixed_issues,
+    should_scrape,
+    mark_scraped,
+    print_request_stats,
+)
+from query_planner import QueryPlanner
+from db_profile import connect
+
+# GraphQL version of populate_db_from_prs. one query per page of merged PRs gets
+# the PRs with their closing issues, changed file paths and base/head oids, plus
+# the repo languages on the first page, instead of 1 languages call + 3 PR pages
+# + 1 files call per linked PR over REST. rows go into the same fixed_issues table
+
+MAX_PRS = 100  # merged PRs looked at per repo
+
+# page sizes come from the planner, which tunes them off the reported query cost
+PLANNER = QueryPlanner()
+
+PR_FRAGMENT = """
+fragment prFields on PullRequest {
+    number
+    url
+    body
+    baseRefOid
+    headRefOid
+    closingIssuesReferences(first: $issues) { nodes { url } }
+    files(first: $files) { totalCount nodes { path } }
+}
+"""
+
+# one repository block, {i} is the alias suffix for the batched query
+REPO_BLOCK = """
+    languages(first: 100, orderBy: {{field: SIZE, direction: DESC}}) @include(if: $withLanguages{i}) {{ nodes {{ name }} }}
+    pullRequests(states: MERGED, first: $prs, after: $cursor{i}, orderBy: {{field: UPDATED_AT, direction: DESC}}) {{
+        pageInfo {{ hasNextPage endCursor }}
+        nodes {{ ...prFields }}
+    }}
+"""
+
+REPO_QUERY = """
+query($owner: String!, $name: String!, $cursor: String, $prs: Int!, $files: Int!, $issues: Int!, $withLanguages: Boolean!) {
+    rateLimit { cost remaining resetAt }
+    repository(owner: $owner, name: $name) {%s}
+}
+""" % REPO_BLOCK.format(i="") + PR_FRAGMENT
+
+BATCH_SIZE = 10  # repos per batched query
+PRS_PER_REPO = 20  # PRs per repo per batched query
+
+
+@lru_cache(maxsize=None)
+def build_batch_query(n):
+    """one document with n aliased repositories (r0, r1, ...), each with its own cursor"""
+    var_defs = "".join(
+        f", $owner{i}: String!, $name{i}: String!, $cursor{i}: String, $withLanguages{i}: Boolean!" for i in range(n)
+    )
+    blocks = "".join(
+        f"\n    r{i}: repository(owner: $owner{i}, name: $name{i}) {{{REPO_BLOCK.format(i=i)}}}" for i in range(n)
+    )
+    return (
+        f"query($prs: Int!, $files: Int!, $issues: Int!{var_defs}) {{\n"
+        f"    rateLimit {{ cost remaining resetAt }}{blocks}\n}}\n" + PR_FRAGMENT
+    )
+
+
+def linked_issues(pr, repo_name):
+    """issues the PR closes according to GitHub, falls back to the body regex"""
+    issues = [issue["url"] for issue in pr["closingIssuesReferences"]["nodes"]]
+    if issues:
+        return issues
+    # closing refs only get recorded for PRs into the default branch, the regex
+    # still catches "fixes #N" on everything else
+    return get_issues_from_pr({"body": pr.get("body") or ""}, repo_name)
+
+
+def affected_files(pr):
+    files = pr["files"]
+    if files["totalCount"] > len(files["nodes"]):
+        # more files than one connection page holds, REST pages through the rest
+        return get_affected_files(pr["url"])
+    return json.dumps([f["path"] for f in files["nodes"]])
+
+
+def pr_rows(pr, repo_name, languages):
+    """fixed_issues rows for a GraphQL PR node, same shape as fixed_issue_rows"""
+    issues = linked_issues(pr, repo_name)
+    if not issues:
+        return []
+    before_code_url = f"https://github.com/{repo_name}/commit/{pr['baseRefOid']}" if pr.get("baseRefOid") else None
+    after_code_url = f"https://github.com/{repo_name}/commit/{pr['headRefOid']}" if pr.get("headRefOid") else None
+    files = affected_files(pr)
+    return [
+        (issue_url, repo_name, pr["url"], languages, before_code_url, after_code_url, files)
+        for issue_url in issues
+    ]
+
+
+def fetch_repo_pages(repo_name, max_prs=MAX_PRS):
+    """yields (languages, pr nodes, plan) per page of merged PRs, languages only filled on the first.
+    raises FetchError if a page can't be had"""
+    owner, name = repo_name.split("/", 1)
+    cursor = None
+    fetched = 0
+    page = 1
+    while fetched < max_prs:
+        plan = PLANNER.next_plan()
+        # the last page can be cut short by max_prs, record it under what was actually asked for
+        plan["prs"] = min(plan["prs"], max_prs - fetched)
+        variables = {
+            "owner": owner,
+            "name": name,
+            "cursor": cursor,
+            "prs": plan["prs"],
+            "files": plan["files"],
+            "issues": plan["issues"],
+            "withLanguages": page == 1,
+        }
+        data = graphql_request(REPO_QUERY, variables)
+        repo = ((data or {}).get("data") or {}).get("repository")
+        if not repo:
+            if data is None:
+                PLANNER.record_failure(plan)
+            raise FetchError(f"failed to fetch PRs for {repo_name} over graphql (page {page})")
+        nodes = repo["pullRequests"]["nodes"]
+        PLANNER.record(plan, data["data"].get("rateLimit"), nodes, label=f"{repo_name} page {page}")
+        languages = None
+        if page == 1:
+            languages = json.dumps([node["name"] for node in repo["languages"]["nodes"]])
+        yield languages, nodes, plan
+        fetched += len(nodes)
+        info = repo["pullRequests"]["pageInfo"]
+        if not info["hasNextPage"]:
+            return
+        cursor = info["endCursor"]
+        page += 1
+
+
+def populate_db_from_graphql(repos, max_prs=MAX_PRS, skip_unchanged=True):
+    conn = connect()
+    cursor = conn.cursor()
+    total_added = 0
+
+    for repo in repos:
+        repo_name = repo["full_name"]
+        if not should_scrape(cursor, repo, skip_unchanged):
+            continue
+        print(f"\n processing repo: {repo_name}")
+        added_for_repo = 0
+        languages = "[]"
+        try:
+            for page_languages, prs, plan in fetch_repo_pages(repo_name, max_prs=max_prs):
+                if page_languages is not None:
+                    languages = page_languages
+                rows = [row for pr in prs for row in pr_rows(pr, repo_name, languages)]
+                PLANNER.record_rows(plan, len(rows))
+                added_for_repo += insert_fixed_issues(cursor, rows)
+        except FetchError as e:
+            # keep the rows we got, but don't mark it scraped so it's redone next run
+            conn.commit()
+            print(f"{e}, leaving {repo_name} for the next run")
+            continue
+        mark_scraped(cursor, repo)
+        conn.commit()
+        total_added += added_for_repo
+        print(f"{added_for_repo} entries for {repo_name} added")
+
+    conn.close()
+    return total_added
+
+
+class _RepoCursor:
+    """where one repo in the batch rotation has got to"""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.repo_name = repo["full_name"]
+        self.cursor = None
+        self.fetched = 0
+        self.added = 0
+        self.languages = None
+
+
+def populate_db_from_graphql_batched(
+    repos, batch_size=BATCH_SIZE, prs_per_repo=PRS_PER_REPO, max_prs=MAX_PRS, skip_unchanged=True
+):
+    """
+    packs batch_size repos into each query via aliases. repos that have more
+    PRs to go keep their cursor and go back in the queue for a later batch
+    """
+    conn = connect()
+    cursor = conn.cursor()
+    total_added = 0
+    pending = deque(_RepoCursor(repo) for repo in repos if should_scrape(cursor, repo, skip_unchanged))
+    conn.commit()
+
+    while pending:
+        batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+        plan = PLANNER.next_plan()
+        variables = {"prs": prs_per_repo, "files": plan["files"], "issues": plan["issues"]}
+        for i, state in enumerate(batch):
+            owner, name = state.repo_name.split("/", 1)
+            variables.update({
+                f"owner{i}": owner,
+                f"name{i}": name,
+                f"cursor{i}": state.cursor,
+                f"withLanguages{i}": state.languages is None,
+            })
+
+        data = graphql_request(build_batch_query(len(batch)), variables)
+        results = (data or {}).get("data") or {}
+        if not results:
+            print(f"failed to fetch batch of {len(batch)} repos over graphql: {[s.repo_name for s in batch]}")
+            continue
+
+        batch_nodes = []
+        for i, state in enumerate(batch):
+            repo = results.get(f"r{i}")
+            if not repo:
+                print(f"no graphql data for {state.repo_name}, skipping it")
+                continue
+            if state.languages is None:
+                state.languages = json.dumps([node["name"] for node in repo["languages"]["nodes"]])
+            nodes = repo["pullRequests"]["nodes"]
+            batch_nodes.extend(nodes)
+            try:
+                rows = [row for pr in nodes for row in pr_rows(pr, state.repo_name, state.languages)]
+            except FetchError as e:
+                # a REST files fallback failed, drop the repo from the rotation unmarked
+                print(f"{e}, leaving {state.repo_name} for the next run")
+                continue
+            state.added += insert_fixed_issues(cursor, rows)
+            state.fetched += len(nodes)
+
+            info = repo["pullRequests"]["pageInfo"]
+            if info["hasNextPage"] and state.fetched < max_prs:
+                state.cursor = info["endCursor"]
+                pending.append(state)
+            else:
+                mark_scraped(cursor, state.repo)
+                total_added += state.added
+                print(f"{state.added} entries for {state.repo_name} added")
+        conn.commit()
+        PLANNER.record_batch(
+            dict(plan, prs=prs_per_repo * len(batch)), results.get("rateLimit"), batch_nodes,
+            label=f"batch of {len(batch)} repos",
+        )
+
+    conn.close()
+    return total_added
+
+
+if __name__ == "__main__":
+    print("starting (graphql)...")
+
+    create_db()
+
+    start = time.time()
+    repos = iter_mit_repos(query="stars:>50000", per_page=100, pages=10)
+    count = populate_db_from_graphql(repos)
+    print(f"\n {count} issue-PR pairs added to .db in {time.time() - start:.1f}s")
+
+    check_db()
+
+    print_request_stats()
+    for size, stats in PLANNER.stats().items():
+        print(f"  {size} PRs/page: {stats['queries']} queries, {stats['points']} points, {stats['rows_per_point']} rows/point")
+
+    print("\n done! \n")
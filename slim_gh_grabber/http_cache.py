@@ -0,0 +1,233 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# remembers the ETag / Last-Modified of every 200 along with its body, keyed by
+# url, so the next run can send If-None-Match / If-Modified-Since. GitHub doesn't
+# charge a 304 against the rate limit, so rerunning over repos that haven't
+# changed costs next to nothing. bodies are zlib'd and the file is kept under
+# max_bytes by dropping the least recently used entries, same as ResponseCache
+
+# headers worth keeping for callers that read them off a cached response
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Link")
+
+
+class CachedResponse:
+    def __init__(self, url, etag, last_modified, body, headers):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+        self.headers = headers
+
+    def validators(self):
+        """conditional request headers for this entry"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_response(self):
+        """rebuild a requests.Response so callers can't tell it came from disk"""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = self.url
+        response._content = self.body
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = "utf-8"
+        response.from_cache = True
+        return response
+
+
+def _evict(conn, table, total_bytes, target):
+    """drop least recently used rows until total_bytes <= target, returns (total_bytes, rows dropped)"""
+    rows = conn.execute(f"SELECT url, size FROM {table} ORDER BY last_used").fetchall()
+    dropped = []
+    for url, size in rows:
+        if total_bytes <= target:
+            break
+        dropped.append((url,))
+        total_bytes -= size
+    conn.executemany(f"DELETE FROM {table} WHERE url = ?", dropped)
+    return total_bytes, len(dropped)
+
+
+DEFAULT_VALIDATOR_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ValidatorCache:
+    def __init__(self, path="etag_cache.db", max_bytes=DEFAULT_VALIDATOR_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(validators)")]
+        if columns and "size" not in columns:
+            # old uncompressed layout, it's only a cache so start it over
+            self.conn.execute("DROP TABLE validators")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS validators (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT,
+                body BLOB,
+                size INTEGER,
+                stored_at REAL,
+                last_used REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS validators_last_used ON validators (last_used)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM validators").fetchone()[0]
+        self.hits = 0  # 304s answered from disk
+        self.misses = 0  # conditional requests that came back with new content
+        self.evicted = 0
+
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, headers, body FROM validators WHERE url = ?", (url,)
+            ).fetchone()
+        if not row:
+            return None
+        etag, last_modified, headers, body = row
+        return CachedResponse(url, etag, last_modified, zlib.decompress(body), json.loads(headers or "{}"))
+
+    def not_modified(self, cached):
+        """server said 304, hand back what we had"""
+        with self.lock:
+            self.hits += 1
+            self.conn.execute("UPDATE validators SET last_used = ? WHERE url = ?", (time.time(), cached.url))
+            self.conn.commit()
+        return cached.to_response()
+
+    def store(self, url, response, revalidated=False):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        headers = {k: response.headers[k] for k in KEPT_HEADERS if k in response.headers}
+        body = zlib.compress(response.content)
+        now = time.time()
+        with self.lock:
+            if revalidated:
+                self.misses += 1
+            old = self.conn.execute("SELECT size FROM validators WHERE url = ?", (url,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, json.dumps(headers), body, len(body), now, now),
+            )
+            self.total_bytes += len(body)
+            if self.max_bytes and self.total_bytes > self.max_bytes:
+                # back under 90% of the cap
+                self.total_bytes, dropped = _evict(self.conn, "validators", self.total_bytes, self.max_bytes * 0.9)
+                self.evicted += dropped
+            self.conn.commit()
+
+    def stats(self):
+        return {"not_modified": self.hits, "changed": self.misses, "evicted": self.evicted, "bytes": self.total_bytes}
+
+
+
+# opt-in cache that answers straight from disk, no round trip at all, while an
+# entry is still inside its endpoint's TTL. bodies are zlib'd and the file is
+# kept under max_bytes by dropping the least recently used entries
+
+DAY = 24 * 3600
+
+# first matching pattern wins, None = never expires
+DEFAULT_TTLS = [
+    (r"/pulls/\d+/files", None),  # merged PRs don't change
+    (r"/languages$", 7 * DAY),
+    (r"/search/", DAY),
+    (r"/pulls\?", 3600),
+    # 0 = always revalidate (ETag'd, so still cheap). a stale events page next to a
+    # fresh PR list would lose event-only links once the watermark moves past them
+    (r"/issues/events", 0),
+    (r".", DAY),
+]
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ResponseCache:
+    def __init__(self, path="response_cache.db", ttls=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (ttls or DEFAULT_TTLS)]
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                headers TEXT,
+                body BLOB,
+                size INTEGER,
+                stored_at REAL,
+                last_used REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def ttl_for(self, url):
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return 0
+
+    def get(self, url):
+        """a fresh cached response, or None if we have to go to the network"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT headers, body, stored_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            ttl = self.ttl_for(url)
+            if not row or (ttl is not None and now - row[2] > ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE url = ?", (now, url))
+            self.conn.commit()
+        headers, body, _ = row
+        return CachedResponse(url, None, None, zlib.decompress(body), json.loads(headers)).to_response()
+
+    def store(self, url, response):
+        headers = {k: response.headers[k] for k in KEPT_HEADERS if k in response.headers}
+        body = zlib.compress(response.content)
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (url, json.dumps(headers), body, len(body), now, now),
+            )
+            self.total_bytes += len(body)
+            if self.max_bytes and self.total_bytes > self.max_bytes:
+                # back under 90% of the cap
+                self.total_bytes, dropped = _evict(self.conn, "responses", self.total_bytes, self.max_bytes * 0.9)
+                self.evicted += dropped
+            self.conn.commit()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted, "bytes": self.total_bytes}
@@ -0,0 +1,93 @@
+import threading
+import time
+
+# reads the X-RateLimit-* headers off every response and spaces requests out so
+# the remaining budget lasts until the window resets. while there's plenty of
+# budget left it doesn't wait at all, it only starts spreading requests once
+# remaining drops below PACE_BELOW of the limit, so we never run dry and stall on a 403
+
+PACE_BELOW = 0.2  # start pacing once remaining < 20% of the limit
+RESERVE = 5  # requests kept back per bucket for retries etc
+
+
+def resource_for(url):
+    """which rate limit bucket a url counts against"""
+    if "/search/" in url:
+        return "search"
+    if url.endswith("/graphql"):
+        return "graphql"
+    return "core"
+
+
+class _Bucket:
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.next_slot = 0.0
+
+
+class RatePacer:
+    def __init__(self, pace_below=PACE_BELOW, reserve=RESERVE):
+        self.pace_below = pace_below
+        self.reserve = reserve
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.waited = 0.0
+
+    def _bucket(self, key):
+        return self.buckets.setdefault(key, _Bucket())
+
+    def delay(self, key, now=None):
+        """seconds to wait before the next request on this bucket, and book the slot"""
+        now = now if now is not None else time.time()
+        with self.lock:
+            b = self._bucket(key)
+            if b.remaining is None or b.reset is None:
+                return 0.0
+            if now >= b.reset:
+                # window rolled over, wait for fresh headers before pacing again
+                b.remaining = None
+                return 0.0
+
+            usable = b.remaining - self.reserve
+            if usable <= 0:
+                # spent, just sit out the rest of the window
+                wait = b.reset - now + 1
+                b.next_slot = b.reset + 1
+                return wait
+            b.remaining -= 1
+
+            if b.limit and b.remaining >= b.limit * self.pace_below:
+                return 0.0
+
+            interval = (b.reset - now) / usable
+            slot = max(now, b.next_slot)
+            b.next_slot = slot + interval
+            return slot - now
+
+    def wait(self, key):
+        delay = self.delay(key)
+        if delay > 0:
+            if delay > 5:
+                print(f"rate limit budget low ({key}), pacing for {delay:.2f} seconds...")
+            self.waited += delay
+            time.sleep(delay)
+
+    def update(self, key, headers):
+        """record the budget the server reported on a response"""
+        if "X-RateLimit-Remaining" not in headers or "X-RateLimit-Reset" not in headers:
+            return
+        with self.lock:
+            b = self._bucket(key)
+            b.remaining = int(headers["X-RateLimit-Remaining"])
+            b.reset = int(headers["X-RateLimit-Reset"])
+            if "X-RateLimit-Limit" in headers:
+                b.limit = int(headers["X-RateLimit-Limit"])
+
+    def stats(self):
+        with self.lock:
+            return {
+                key: {"remaining": b.remaining, "limit": b.limit, "reset": b.reset}
+                for key, b in self.buckets.items()
+            }
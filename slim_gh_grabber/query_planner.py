@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+
+# picks page sizes for the graphql PR queries from what rateLimit { cost } says
+# each query actually cost. GitHub charges roughly (connection requests / 100),
+# rounded, min 1, where every PR asks for its files and closing issues as two more
+# connections. so the number of PRs per page is what moves the cost, and files /
+# issues per PR only change how much of each PR we get back in one go.
+# the planner keeps rows per point for each PR page size it has tried and goes
+# with the best, doubles files/issues when PRs come back truncated (smaller
+# responses until a repo actually needs more), and backs off the page size when
+# big queries start failing
+
+PR_SIZES = (25, 50, 70, 100)  # 70 is about the most that still costs 1 point
+MAX_FILES = 100
+MAX_ISSUES = 50
+
+
+def estimate_cost(prs, connections_per_pr=2, extra=1):
+    """GitHub's published formula, used until we've seen a real cost"""
+    return max(1, round((1 + extra + prs * connections_per_pr) / 100))
+
+
+class _SizeStats:
+    def __init__(self):
+        self.queries = 0
+        self.points = 0
+        self.rows = 0
+        self.failures = 0
+
+
+class QueryPlanner:
+    def __init__(self, files=25, issues=10, log_path="graphql_costs.jsonl"):
+        self.files = files
+        self.issues = issues
+        self.sizes = {size: _SizeStats() for size in PR_SIZES}
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        self.prs_seen = 0
+        self.rows_seen = 0
+
+    def _rows_per_pr(self):
+        # until anything's come back assume every PR is worth the same
+        return self.rows_seen / self.prs_seen if self.prs_seen else 1.0
+
+    def _rows_per_point(self, size):
+        stats = self.sizes[size]
+        cost = stats.points / stats.queries if stats.queries else estimate_cost(size)
+        return self._rows_per_pr() * size / max(cost, 1)
+
+    def next_plan(self):
+        """page sizes for the next query"""
+        with self.lock:
+            # short last pages get recorded under their own size, only pick from the standard ones
+            candidates = [size for size in PR_SIZES if self.sizes[size].failures < 2] or [min(PR_SIZES)]
+            prs = max(candidates, key=lambda size: (self._rows_per_point(size), -size))
+            return {"prs": prs, "files": self.files, "issues": self.issues}
+
+    def record(self, plan, rate_limit, pr_nodes, label=""):
+        """what a query cost and what came back, pr_nodes = every PR node in the response.
+        plan["prs"] has to be the page size actually sent"""
+        cost = (rate_limit or {}).get("cost") or estimate_cost(plan["prs"])
+        with self.lock:
+            stats = self.sizes.setdefault(plan["prs"], _SizeStats())
+            stats.queries += 1
+            stats.points += cost
+            self.prs_seen += len(pr_nodes)
+        self.record_batch(plan, rate_limit, pr_nodes, label)
+
+    def record_batch(self, plan, rate_limit, pr_nodes, label=""):
+        """log a query and adjust files/issues, without counting it against a page size
+        (multi-repo batches cost differently to a single repo page)"""
+        cost = (rate_limit or {}).get("cost") or estimate_cost(plan["prs"])
+        with self.lock:
+            # files/issues cut short means more calls later, so ask for more next time
+            if any(pr["files"]["totalCount"] > len(pr["files"]["nodes"]) for pr in pr_nodes):
+                self.files = min(MAX_FILES, plan["files"] * 2)
+            if any(len(pr["closingIssuesReferences"]["nodes"]) >= plan["issues"] for pr in pr_nodes):
+                self.issues = min(MAX_ISSUES, plan["issues"] * 2)
+        self._log({
+            "at": time.time(),
+            "query": label,
+            "plan": plan,
+            "cost": cost,
+            "remaining": (rate_limit or {}).get("remaining"),
+            "prs": len(pr_nodes),
+        })
+
+    def record_rows(self, plan, rows):
+        with self.lock:
+            self.sizes.setdefault(plan["prs"], _SizeStats()).rows += rows
+            self.rows_seen += rows
+
+    def record_failure(self, plan):
+        """a query that errored/timed out, usually because it was too heavy"""
+        with self.lock:
+            self.sizes.setdefault(plan["prs"], _SizeStats()).failures += 1
+
+    def _log(self, entry):
+        print(f"  graphql {entry['query']}: cost {entry['cost']} for {entry['prs']} PRs, plan {entry['plan']}, {entry['remaining']} left")
+        if self.log_path:
+            with self.lock, open(self.log_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def stats(self):
+        with self.lock:
+            return {
+                size: {
+                    "queries": s.queries,
+                    "points": s.points,
+                    "rows": s.rows,
+                    "rows_per_point": round(s.rows / s.points, 2) if s.points else None,
+                    "failures": s.failures,
+                }
+                for size, s in self.sizes.items()
+                if s.queries or s.failures
+            }
@@ -0,0 +1,82 @@
+import random
+import threading
+
+# decides what make_request does with a response that isn't a 200/304:
+#   "rate_limited"  primary limit (remaining == 0), bench the token until reset
+#   "secondary"     secondary/abuse limit, bench the token for Retry-After or a
+#                   minute-ish, doesn't matter how much budget is left
+#   "retry"         5xx / 429 / dropped connection, exponential backoff with full jitter
+#   "fail"          anything else, give up straight away
+# retries are capped at max_attempts so a server that stays broken can't hang
+# the run, and the jitter stops a pile of threads all coming back at once
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+SECONDARY_MARKERS = ("secondary rate limit", "abuse")
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=6, base=1.0, cap=60.0, secondary_wait=60.0):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.secondary_wait = secondary_wait
+        self.retries = 0
+        self.gave_up = 0
+        self.lock = threading.Lock()
+
+    def classify(self, response):
+        status = response.status_code
+        if status in (403, 429):
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                return "rate_limited"
+            if self.is_secondary_limit(response):
+                return "secondary"
+        if status in RETRY_STATUSES:
+            return "retry"
+        return "fail"
+
+    def is_secondary_limit(self, response):
+        if "Retry-After" in response.headers and response.status_code == 403:
+            return True
+        try:
+            message = response.json().get("message", "").lower()
+        except (ValueError, AttributeError):
+            return False
+        return any(marker in message for marker in SECONDARY_MARKERS)
+
+    def backoff(self, attempt):
+        """full jitter: anywhere between 0 and base * 2^attempt, capped"""
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def retry_after(self, response):
+        """seconds from a Retry-After header, None if there isn't a usable one"""
+        value = response.headers.get("Retry-After") if response is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+
+    def delay(self, response, attempt):
+        """how long to wait before trying again"""
+        wait = self.retry_after(response)
+        if wait is not None:
+            # a little spread so everyone told the same Retry-After doesn't return together
+            return wait + random.uniform(0, 1 + wait * 0.1)
+        if response is not None and self.classify(response) == "secondary":
+            # no hint from the server, a minute plus some spread
+            return self.secondary_wait + random.uniform(0, self.secondary_wait / 2)
+        return self.backoff(attempt)
+
+    def should_retry(self, attempt):
+        """attempt = how many tries have failed so far"""
+        with self.lock:
+            if attempt < self.max_attempts:
+                self.retries += 1
+                return True
+            self.gave_up += 1
+            return False
+
+    def stats(self):
+        return {"retries": self.retries, "gave_up": self.gave_up}
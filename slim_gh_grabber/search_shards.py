@@ -0,0 +1,137 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from slim_scraper import make_request, paginate
+
+# the search API stops at 1000 results per query, so stars:>500 can never get
+# past the first 1000 MIT repos. this splits the query into star ranges (and
+# created: date ranges once a single star count is still too big) until every
+# shard is under the cap, runs the shards side by side and de-dupes the repos.
+# the search bucket is 30 requests/min per token, the pacer and token pool
+# already keep us inside that, the worker count just caps how many are in flight
+
+SEARCH_CAP = 1000
+SHARD_WORKERS = 3
+FIRST_CREATED = date(2007, 10, 1)  # nothing on GitHub is older than this
+
+SEARCH_URL = "https://api.github.com/search/repositories?q={q}+license:mit&sort=stars&order=desc"
+
+
+class Shard:
+    def __init__(self, terms, lo, hi, created=None):
+        self.terms = terms  # the rest of the query, stars qualifier removed
+        self.lo = lo
+        self.hi = hi  # None = no upper bound
+        self.created = created  # (start, end) dates or None
+
+    def query(self):
+        stars = f"stars:{self.lo}..{self.hi}" if self.hi is not None else f"stars:>={self.lo}"
+        parts = self.terms + [stars]
+        if self.created:
+            parts.append(f"created:{self.created[0].isoformat()}..{self.created[1].isoformat()}")
+        return "+".join(parts)
+
+    def __repr__(self):
+        return f"Shard({self.query()})"
+
+
+def parse_stars(query):
+    """split "stars:>500+topic:x" into (["topic:x"], 501, None)"""
+    terms = [t for t in re.split(r"[+ ]", query) if t]
+    lo, hi = 0, None
+    rest = []
+    for term in terms:
+        match = re.fullmatch(r"stars:(>=|>|<=|<)?(\d+)(?:\.\.(\d+|\*))?", term)
+        if not match:
+            rest.append(term)
+            continue
+        op, first, second = match.groups()
+        first = int(first)
+        if second is not None:
+            lo, hi = first, None if second == "*" else int(second)
+        elif op == ">":
+            lo = first + 1
+        elif op == ">=":
+            lo = first
+        elif op == "<":
+            hi = first - 1
+        elif op == "<=":
+            hi = first
+        else:
+            lo = hi = first
+    return rest, lo, hi
+
+
+def count_results(query):
+    response = make_request(SEARCH_URL.format(q=query) + "&per_page=1")
+    if not response:
+        return None
+    return response.json().get("total_count", 0)
+
+
+def plan_shards(query):
+    """break a search query into shards that each have <= 1000 results"""
+    terms, lo, hi = parse_stars(query)
+    todo = [Shard(terms, lo, hi)]
+    shards = []
+    while todo:
+        shard = todo.pop()
+        total = count_results(shard.query())
+        if total is None:
+            print(f"couldn't count {shard}, skipping it")
+            continue
+        if total <= SEARCH_CAP:
+            if total:
+                shards.append(shard)
+            continue
+        parts = split(shard)
+        if parts == [shard]:
+            # can't be split any further, take the first 1000
+            print(f"{shard} has {total} results even on its own, only the first {SEARCH_CAP} will be fetched")
+            shards.append(shard)
+        else:
+            todo.extend(parts)
+    print(f"{query} split into {len(shards)} shards")
+    return shards
+
+
+def split(shard):
+    """halve the star range, or the created range once it's down to one star count"""
+    if shard.hi is None:
+        # open ended, most repos sit near the bottom so cut close to lo
+        mid = max(shard.lo * 2, shard.lo + 1)
+        return [Shard(shard.terms, shard.lo, mid - 1, shard.created), Shard(shard.terms, mid, None, shard.created)]
+    if shard.hi > shard.lo:
+        mid = (shard.lo + shard.hi) // 2
+        return [Shard(shard.terms, shard.lo, mid, shard.created), Shard(shard.terms, mid + 1, shard.hi, shard.created)]
+    start, end = shard.created or (FIRST_CREATED, date.today())
+    if end > start:
+        mid = start + (end - start) // 2
+        return [
+            Shard(shard.terms, shard.lo, shard.hi, (start, mid)),
+            Shard(shard.terms, shard.lo, shard.hi, (mid + timedelta(days=1), end)),
+        ]
+    return [shard]
+
+
+def fetch_shard(shard):
+    repos = []
+    for _, items in paginate(SEARCH_URL.format(q=shard.query()), per_page=100, items_key="items"):
+        repos.extend(items)
+    print(f"{len(repos)} repos from {shard}")
+    return repos
+
+
+def get_mit_repos_sharded(query="stars:>500", workers=SHARD_WORKERS):
+    """every MIT repo matching query, past the 1000 result cap, most stars first"""
+    shards = plan_shards(query)
+    seen = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for repos in executor.map(fetch_shard, shards):
+            for repo in repos:
+                # shards shouldn't overlap, but stars move while we're paging
+                seen.setdefault(repo["full_name"], repo)
+    repos = sorted(seen.values(), key=lambda repo: repo.get("stargazers_count", 0), reverse=True)
+    print(f"\n {len(repos)} unique MIT repos across {len(shards)} shards")
+    return repos
@@ -1,254 +1,740 @@
 import requests
-import sqlite3
 import json
 import time
 import os
 import re
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from pacer import RatePacer, resource_for
+from token_pool import TokenPool
+from http_cache import ValidatorCache, ResponseCache
+from retry_policy import RetryPolicy
+from hedge import Hedger
+from single_flight import SingleFlight
+from db_writer import DbWriter
+from db_profile import DB_PATH, connect
+from fixed_issues import (
+    FIXED_ISSUES_INSERT,
+    PR_FILES_INSERT,
+    create_db,
+    check_db,
+    get_issues_from_pr,
+    fixed_issue_rows,
+    insert_fixed_issues,
+)
 
 # uses dotenv in local dir
 
 load_dotenv()
-TOKEN = os.getenv("GITHUB_TOKEN")
+# GITHUB_TOKENS is a comma separated list for when we've got more than one,
+# GITHUB_TOKEN still works on its own
+TOKENS = [t.strip() for t in os.getenv("GITHUB_TOKENS", "").split(",") if t.strip()]
+if os.getenv("GITHUB_TOKEN") and os.getenv("GITHUB_TOKEN") not in TOKENS:
+    TOKENS.insert(0, os.getenv("GITHUB_TOKEN"))
+TOKEN = TOKENS[0] if TOKENS else None
 
 if not TOKEN:
     raise ValueError("gh token is missing")
 
+GRAPHQL_URL = "https://api.github.com/graphql"
+
 HEADERS = {
     "Authorization": f"token {TOKEN}",
     "Accept": "application/vnd.github.v3+json",
 }
 
+# one keep-alive session shared by every request, so we pay the TCP+TLS
+# handshake to api.github.com once per pooled connection instead of once per call
+POOL_SIZE = int(os.getenv("GH_POOL_SIZE", "16"))
+
+_session = None
+_session_lock = threading.Lock()
+_closed_stats = {"requests": 0, "connections": 0}
+
+def configure_session(pool_size=None):
+    """(re)build the shared session, pool_size = max connections kept alive per host"""
+    global POOL_SIZE
+    with _session_lock:
+        if pool_size:
+            POOL_SIZE = pool_size
+        return _build_session()
+
+def _build_session():
+    # caller holds _session_lock
+    global _session
+    if _session is not None:
+        # keep the counts from the old pool so http_stats covers the whole run
+        for k, v in _pool_stats(_session).items():
+            _closed_stats[k] += v
+        _session.close()
+    _session = requests.Session()
+    _session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+    _session.mount("https://", adapter)
+    return _session
+
+def get_session():
+    session = _session
+    if session is None:
+        # checked again under the lock, or threads making their first request at
+        # the same time each build a session and close the one the others are using
+        with _session_lock:
+            session = _session if _session is not None else _build_session()
+    return session
+
+def _pool_stats(session):
+    stats = {"requests": 0, "connections": 0}
+    pools = session.get_adapter("https://api.github.com").poolmanager.pools
+    for key in pools.keys():
+        pool = pools[key]
+        stats["requests"] += pool.num_requests
+        stats["connections"] += pool.num_connections
+    return stats
+
+def http_stats():
+    """requests sent vs connections (handshakes) opened by the shared session"""
+    stats = dict(_closed_stats)
+    if _session is not None:
+        for k, v in _pool_stats(_session).items():
+            stats[k] += v
+    return stats
+
+# shared by every thread, paces each token against its X-RateLimit-* headers
+PACER = RatePacer()
+TOKEN_POOL = TokenPool(TOKENS)
+RETRY = RetryPolicy(max_attempts=int(os.getenv("GH_MAX_ATTEMPTS", "6")))
+
+# a stalled socket shouldn't be able to freeze an overnight run. connect/read
+# timeouts per attempt, plus a deadline on the whole logical call (retries and
+# backoff included, waiting on rate limit budget not)
+CONNECT_TIMEOUT = float(os.getenv("GH_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("GH_READ_TIMEOUT", "30"))
+DEADLINE = float(os.getenv("GH_DEADLINE", "300"))
+
+# GH_HEDGE=1 sends a duplicate GET when one is slower than the recent p95
+HEDGER = Hedger() if os.getenv("GH_HEDGE") == "1" else None
+
+# concurrent calls for the same url share one request
+FLIGHTS = SingleFlight()
+
+# ETag / Last-Modified store for conditional requests, GH_ETAG_CACHE="" turns it off,
+# GH_ETAG_CACHE_MB caps it
+ETAG_CACHE_PATH = os.getenv("GH_ETAG_CACHE", "etag_cache.db")
+ETAG_CACHE = (
+    ValidatorCache(ETAG_CACHE_PATH, max_bytes=int(os.getenv("GH_ETAG_CACHE_MB", "256")) * 1024 * 1024)
+    if ETAG_CACHE_PATH
+    else None
+)
 
-def create_db():
-    conn = sqlite3.connect("fixed_issues.db")
-    conn.execute("PRAGMA journal_mode=WAL;")
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS fixed_issues (
-            issue_url TEXT PRIMARY KEY,
-            repo_name TEXT,
-            pull_request_url TEXT,
-            languages TEXT,
-            before_code_url TEXT,
-            after_code_url TEXT,
-            affected_files TEXT
+# opt-in, serves responses from disk with no request at all while they're inside
+# their TTL. set GH_RESPONSE_CACHE to a path to turn it on, GH_RESPONSE_CACHE_MB caps it
+RESPONSE_CACHE_PATH = os.getenv("GH_RESPONSE_CACHE")
+RESPONSE_CACHE = (
+    ResponseCache(RESPONSE_CACHE_PATH, max_bytes=int(os.getenv("GH_RESPONSE_CACHE_MB", "512")) * 1024 * 1024)
+    if RESPONSE_CACHE_PATH
+    else None
+)
+
+
+def get_watermark(cursor, repo_name):
+    """updated_at of the newest PR we've already been through for this repo"""
+    row = cursor.execute("SELECT pr_watermark FROM repos WHERE full_name = ?", (repo_name,)).fetchone()
+    return row[0] if row else None
+
+def set_watermark(cursor, repo_name, prs):
+    """move the watermark up to the newest updated_at in prs (never back)"""
+    newest = max((pr["updated_at"] for pr in prs if pr.get("updated_at")), default=None)
+    if newest:
+        cursor.execute(
+            "UPDATE repos SET pr_watermark = ? WHERE full_name = ? AND (pr_watermark IS NULL OR pr_watermark < ?)",
+            (newest, repo_name, newest),
         )
-    """)
-    conn.commit()
-    conn.close()
 
-def make_request(url):
-    """rate limits etc handler"""
+def upsert_repo(cursor, repo):
+    """record/refresh a repo from its search payload, keeps the scrape bookkeeping"""
+    cursor.execute(
+        """
+        INSERT INTO repos (full_name, stars, language, pushed_at, default_branch)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(full_name) DO UPDATE SET
+            stars = excluded.stars,
+            language = excluded.language,
+            pushed_at = COALESCE(excluded.pushed_at, repos.pushed_at),
+            default_branch = COALESCE(excluded.default_branch, repos.default_branch)
+        """,
+        (repo["full_name"], repo.get("stargazers_count"), repo.get("language"), repo.get("pushed_at"), repo.get("default_branch")),
+    )
+
+def is_unchanged(cursor, repo):
+    """True if nothing's been pushed to the repo since we last scraped it"""
+    if not repo.get("pushed_at"):
+        return False
+    row = cursor.execute("SELECT scraped_pushed_at FROM repos WHERE full_name = ?", (repo["full_name"],)).fetchone()
+    return bool(row and row[0] == repo["pushed_at"])
+
+def mark_scraped(cursor, repo):
+    cursor.execute(
+        "UPDATE repos SET scraped_pushed_at = ?, last_scraped_at = ? WHERE full_name = ?",
+        (repo.get("pushed_at"), time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), repo["full_name"]),
+    )
+
+def should_scrape(cursor, repo, skip_unchanged=True, writer=None):
+    """upsert the repo row and say whether it needs scraping this run (the upsert goes via writer if there is one)"""
+    if writer:
+        writer.call(upsert_repo, repo)
+    else:
+        upsert_repo(cursor, repo)
+    if skip_unchanged and is_unchanged(cursor, repo):
+        print(f"{repo['full_name']} not pushed to since {repo['pushed_at']}, skipping it")
+        return False
+    return True
+
+def make_request(url, deadline=None):
+    """rate limits etc handler, deadline = seconds the whole call may take"""
+    return FLIGHTS.do(url, lambda: _make_request(url, deadline))
+
+def _make_request(url, deadline):
+    if RESPONSE_CACHE:
+        response = RESPONSE_CACHE.get(url)
+        if response:
+            return response
+    response = _fetch(url, deadline or DEADLINE)
+    if response is not None and RESPONSE_CACHE:
+        RESPONSE_CACHE.store(url, response)
+    return response
+
+def graphql_request(query, variables=None, deadline=None):
+    """POST a GraphQL query down the same token/pacing/retry path, returns the json (None on failure)"""
+    payload = {"query": query, "variables": variables or {}}
+    for _ in range(RETRY.max_attempts):
+        response = _fetch(GRAPHQL_URL, deadline or DEADLINE, payload)
+        if response is None:
+            return None
+        data = response.json()
+        errors = data.get("errors") or []
+        if any(error.get("type") == "RATE_LIMITED" for error in errors):
+            # the token's budget got updated off the headers, so the pool
+            # hands out a different one (or waits) next time round
+            continue
+        if errors:
+            print(f"graphql errors: {[error.get('message') for error in errors]}")
+        return data
+    return None
+
+def _send(url, headers, timeout, payload=None):
+    if payload is not None:
+        # never hedged, a duplicate graphql query gets charged points again and
+        # skips the token pool / pacer accounting
+        return get_session().post(url, headers=headers, json=payload, timeout=timeout)
+    send = lambda: get_session().get(url, headers=headers, timeout=timeout)
+    return HEDGER.send(send) if HEDGER else send()
+
+def _fetch(url, deadline, payload=None):
+    resource = resource_for(url)
+    cached = ETAG_CACHE.get(url) if ETAG_CACHE and payload is None else None
+    failures = 0
+    deadline_at = time.time() + deadline
     while True:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code == 200:
+        waiting_since = time.time()
+        token = TOKEN_POOL.acquire(resource)
+        PACER.wait((token.name, resource))
+        # time spent waiting on rate limit budget doesn't eat into the deadline
+        deadline_at += time.time() - waiting_since
+        headers = {"Authorization": token.auth}
+        if cached:
+            headers.update(cached.validators())
+        read_timeout = max(1.0, min(READ_TIMEOUT, deadline_at - time.time()))
+        try:
+            response = _send(url, headers, (CONNECT_TIMEOUT, read_timeout), payload)
+        except requests.RequestException as e:
+            failures += 1
+            wait = RETRY.delay(None, failures)
+            if time.time() + wait > deadline_at:
+                print(f"request failed, {deadline:.0f}s deadline used up: {e} for URL: {url}")
+                return None
+            if not RETRY.should_retry(failures):
+                print(f"request failed after {failures} attempts: {e} for URL: {url}")
+                return None
+            print(f"connection error ({e.__class__.__name__}). retrying in {wait:.2f} seconds...")
+            time.sleep(wait)
+            continue
+        PACER.update((token.name, resource), response.headers)
+        TOKEN_POOL.update(token, resource, response.headers)
+        if response.status_code == 304 and cached:
+            return ETAG_CACHE.not_modified(cached)
+        elif response.status_code == 200:
+            if ETAG_CACHE and payload is None:
+                ETAG_CACHE.store(url, response, revalidated=cached is not None)
             return response
-        elif response.status_code == 403 and "X-RateLimit-Reset" in response.headers:
-            reset_time = int(response.headers["X-RateLimit-Reset"])
-            sleep_time = max(0, reset_time - time.time())
-            print(f"rate limit exceeded. sleepytime for {sleep_time:.2f} seconds...")
-            time.sleep(sleep_time)
-        elif response.status_code in [502, 503, 504]:  # server error cocdes
-            print(f"temp error ({response.status_code}). retrying in 5 seconds...")
-            time.sleep(5)
-        else:
+
+        action = RETRY.classify(response)
+        if action == "rate_limited":
+            # bench this token until its reset, the pool hands out another one
+            # (or sleeps if they're all out)
+            TOKEN_POOL.retire(token, resource, int(response.headers["X-RateLimit-Reset"]))
+            continue
+        failures += 1
+        if action == "fail" or not RETRY.should_retry(failures):
             print(f"request failed: {response.status_code} for URL: {url}")
             return None
+        wait = RETRY.delay(response, failures)
+        if action == "secondary":
+            # secondary limits are per token too, so bench it and carry on with the others
+            TOKEN_POOL.retire(token, resource, time.time() + wait)
+        elif time.time() + wait > deadline_at:
+            print(f"request failed, {deadline:.0f}s deadline used up: {response.status_code} for URL: {url}")
+            return None
+        else:
+            print(f"temp error ({response.status_code}). retrying in {wait:.2f} seconds...")
+            time.sleep(wait)
+
+def set_param(url, name, value):
+    """set/replace one query param without re-encoding the rest of the url"""
+    pattern = rf"([?&]){name}=[^&]*"
+    if re.search(pattern, url):
+        return re.sub(pattern, rf"\g<1>{name}={value}", url)
+    return f"{url}{'&' if '?' in url else '?'}{name}={value}"
+
+def _page_number(url):
+    match = re.search(r"[?&]page=(\d+)", url)
+    return int(match.group(1)) if match else 1
+
+def _last_page(response, page):
+    """page number of rel="last", or page itself if this is the last one"""
+    if "last" in response.links:
+        return _page_number(response.links["last"]["url"])
+    return page
+
+def _page_items(response, items_key):
+    data = response.json()
+    return data.get(items_key, []) if items_key else data
+
+class FetchError(Exception):
+    """a request we needed failed for good, so whatever we've got is incomplete"""
+
+def _page_failed(url, page, strict):
+    message = f"failed to fetch {url} (page {page})"
+    if strict:
+        raise FetchError(message)
+    print(message)
+
+def paginate(url, per_page=100, max_pages=None, workers=1, items_key=None, strict=False):
+    """
+    lazily yields (page, items), following Link rel="next" until a short page,
+    max_pages or a failed request. with workers > 1, once the first page tells us
+    rel="last" the rest are fetched in parallel (still yielded in order).
+    strict = a failed page raises FetchError instead of just ending the pages
+    """
+    url = set_param(url, "per_page", per_page)
+    page = 1
+    while max_pages is None or page <= max_pages:
+        response = make_request(set_param(url, "page", page))
+        if not response:
+            _page_failed(url, page, strict)
+            return
+        items = _page_items(response, items_key)
+        yield page, items
+        # a short page is the last one, no point asking for the next
+        if len(items) < per_page or "next" not in response.links:
+            return
+        if workers > 1 and "last" in response.links:
+            last = _page_number(response.links["last"]["url"])
+            if max_pages:
+                last = min(last, max_pages)
+            yield from _parallel_pages(url, page + 1, last, workers, items_key, per_page, strict)
+            return
+        page += 1
+
+def _parallel_pages(url, first, last, workers, items_key, per_page, strict):
+    fetch = lambda page: make_request(set_param(url, "page", page))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for page, response in zip(range(first, last + 1), executor.map(fetch, range(first, last + 1))):
+            if not response:
+                _page_failed(url, page, strict)
+                return
+            items = _page_items(response, items_key)
+            yield page, items
+            if len(items) < per_page:
+                return
+    finally:
+        # on a deep backfill most pages are still queued when we stop early,
+        # don't spend budget on them
+        executor.shutdown(wait=True, cancel_futures=True)
 
 def get_mit_repos(query="stars:>50000", per_page=100, pages=10):
     repos = []
-    for page in range(1, pages + 1):
-        url = f"https://api.github.com/search/repositories?q={query}+license:mit&sort=stars&order=desc&per_page={per_page}&page={page}"
-        response = make_request(url)
-        if response:
-            data = response.json()
-            items = data.get("items", [])
-            repos.extend(items)
-            print(f"{len(items)} repos on page {page}/{pages} found")
-        else:
-            print(f"failed to fetch repos (page {page})")
-            break
+    url = f"https://api.github.com/search/repositories?q={query}+license:mit&sort=stars&order=desc"
+    for page, items in paginate(url, per_page=per_page, max_pages=pages, items_key="items"):
+        repos.extend(items)
+        print(f"{len(items)} repos on page {page}/{pages} found")
     return repos
 
+def iter_mit_repos(query="stars:>50000", per_page=100, pages=10, prefetch=1):
+    """
+    yields repos as soon as their search page lands. a background thread keeps
+    at most `prefetch` pages queued up ahead of whoever's consuming, so the
+    processing overlaps discovery without holding every page in memory
+    """
+    url = f"https://api.github.com/search/repositories?q={query}+license:mit&sort=stars&order=desc"
+    page_queue = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # give up if the consumer's gone away, rather than block forever
+        while not stop.is_set():
+            try:
+                page_queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for page, items in paginate(url, per_page=per_page, max_pages=pages, items_key="items"):
+                print(f"{len(items)} repos on page {page}/{pages} found")
+                if not put(items):
+                    return
+        finally:
+            put(done)
+
+    threading.Thread(target=producer, daemon=True).start()
+    found = 0
+    try:
+        while True:
+            items = page_queue.get()
+            if items is done:
+                break
+            found += len(items)
+            yield from items
+    finally:
+        stop.set()
+    print(f"\n {found} MIT repos found")
+
 def get_languages(repo_name):
     url = f"https://api.github.com/repos/{repo_name}/languages"
     response = make_request(url)
-    return json.dumps(list(response.json().keys())) if response else "[]"
+    if not response:
+        # "[]" would look like a repo with no languages, so don't pretend
+        raise FetchError(f"failed to fetch languages for {repo_name}")
+    return json.dumps(list(response.json().keys()))
 
-def get_affected_files(pr_url):
-    if not pr_url:
-        return "[]"
+# pages of a PR's files fetched side by side once the first says how many there are
+FILE_WORKERS = int(os.getenv("GH_FILE_WORKERS", "4"))
+FILE_FIELDS = ("filename", "status", "additions", "deletions", "changes", "sha")
+
+def _files_url(pr_url):
     #  html URL to API URL flipper
     if "github.com" in pr_url:
         parts = pr_url.split("/")
         owner = parts[-4]
         repo = parts[-3]
         pr_number = parts[-1]
-        files_url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/files"
-    else:
-        files_url = pr_url + "/files"
-    
-    response = make_request(files_url)
-    if response and response.json():
-        return json.dumps([file["filename"] for file in response.json()])
-    return "[]"
+        return f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/files"
+    return pr_url + "/files"
+
+def _file_fields(items):
+    return [{field: file.get(field) for field in FILE_FIELDS} for file in items]
+
+def get_pr_files(pr_url, workers=FILE_WORKERS):
+    """every file a PR touches (the API stops at 3000), with its status/additions/deletions/changes/sha.
+    raises FetchError if a page fails rather than hand back part of the list"""
+    if not pr_url:
+        return []
+    # paged, otherwise anything past the first 30 files gets dropped
+    files = []
+    for _, items in paginate(_files_url(pr_url), per_page=100, workers=workers, strict=True):
+        files.extend(_file_fields(items))
+    return files
+
+def get_pr_files_page(pr_url, page):
+    """(files on one page, last page number), for callers that schedule the pages
+    themselves (the async scraper). same urls as get_pr_files, so same cache entries"""
+    url = set_param(set_param(_files_url(pr_url), "per_page", 100), "page", page)
+    response = make_request(url)
+    if not response:
+        raise FetchError(f"failed to fetch {url}")
+    return _file_fields(response.json()), _last_page(response, page)
+
+def get_affected_files(pr_url):
+    """json list of the file names a PR touches"""
+    return json.dumps([file["filename"] for file in get_pr_files(pr_url)])
 
-def get_merged_prs(repo_name, per_page=30, pages=3):
-    """get merged pull requests for a repo"""
+def pr_file_rows(pr_url, files):
+    return [(pr_url,) + tuple(file[field] for field in FILE_FIELDS) for file in files]
+
+def get_merged_prs_page(repo_name, page, per_page=30):
+    """(merged PRs on one page of closed PRs, last page number), FetchError on failure"""
+    url = f"https://api.github.com/repos/{repo_name}/pulls?state=closed&sort=updated&direction=desc&per_page={per_page}&page={page}"
+    response = make_request(url)
+    if not response:
+        raise FetchError(f"failed to fetch PRs for {repo_name} (page {page})")
+    # include PRs that were actually merged
+    return [pr for pr in response.json() if pr.get("merged_at")], _last_page(response, page)
+
+# parallel PR list pages for backfills
+BACKFILL_WORKERS = int(os.getenv("GH_BACKFILL_WORKERS", "8"))
+
+def get_merged_prs(repo_name, per_page=30, pages=3, since=None, workers=1):
+    """
+    get merged pull requests for a repo. since = watermark (updated_at), only
+    PRs updated after it come back and paging goes on (pages is ignored) until the
+    first page that's entirely older, otherwise the watermark would jump past PRs
+    we never listed. pages=None keeps going until the last page.
+    workers > 1 fetches pages 2..last side by side (still returned in page order).
+    raises FetchError if a page fails, a partial list can't move the watermark
+    """
+    if since:
+        # where the watermark is only shows up page by page
+        workers = 1
+        pages = None
     prs = []
     total_prs = 0
     
     print(f"fetchin merged PRs for {repo_name}...")
     
-    for page in range(1, pages + 1):
-        url = f"https://api.github.com/repos/{repo_name}/pulls?state=closed&sort=updated&direction=desc&per_page={per_page}&page={page}"
-        response = make_request(url)
-        if response:
-            data = response.json()
-            # include PRs that were actually merged
-            merged_prs = [pr for pr in data if pr.get("merged_at")]
-            prs.extend(merged_prs)
-            total_prs += len(merged_prs)
-            print(f"  Page {page}: Found {len(merged_prs)} merged PRs")
-        else:
-            print(f"Failed to fetch PRs for {repo_name} (page {page})")
+    url = f"https://api.github.com/repos/{repo_name}/pulls?state=closed&sort=updated&direction=desc"
+    for page, data in paginate(url, per_page=per_page, max_pages=pages, workers=workers, strict=True):
+        if since:
+            # sorted newest first, so everything from here on has been seen already
+            data = [pr for pr in data if pr.get("updated_at", "") > since]
+        # include PRs that were actually merged
+        merged_prs = [pr for pr in data if pr.get("merged_at")]
+        prs.extend(merged_prs)
+        total_prs += len(merged_prs)
+        print(f"  Page {page}: Found {len(merged_prs)} merged PRs")
+        if since and len(data) < per_page:
+            print(f"  reached the {since} watermark")
             break
-            
-        # a wee rate limit slow down
-        time.sleep(1)
         
     print(f"Found total of {total_prs} merged PRs for {repo_name}")
     return prs
 
-def get_issues_from_pr(pr_data, repo_name):
-    """get linked issues from a pull request"""
-    # Check PR body for issue references
-    body = pr_data.get("body", "")
-    if not body:
-        return []
-    
-    # common issue reference patterns
-    linked_issues = []
+def get_linked_prs(repo_name, per_page=100, pages=1, since=None, linking="body"):
+    """
+    merged PRs that GitHub says close an issue, found with search/issues
+    (linked:issue), so the PRs with no linked issue never get downloaded. a search
+    hit has the body but no base/head shas, so with linking="body" the full PR only
+    gets fetched for the ones whose body actually names the issue, the other modes
+    need them all since the link can be in the sidebar or a commit message instead.
+    with since, pages is ignored so everything updated after the watermark gets
+    listed. raises FetchError on failure
+    """
+    prs = []
     
-    # pattern: "fixes #123", "closes #123", etc.
-    patterns = [
-        r'(?:close[sd]?|fix(?:e[sd])?|resolve[sd]?)\s+#(\d+)',
-        r'(?:close[sd]?|fix(?:e[sd])?|resolve[sd]?)\s+' + repo_name.replace('/', '\/') + r'#(\d+)'
-    ]
+    print(f"searchin linked PRs for {repo_name}...")
     
-    for pattern in patterns:
-        matches = re.findall(pattern, body, re.IGNORECASE)
-        for issue_num in matches:
-            issue_url = f"https://github.com/{repo_name}/issues/{issue_num}"
-            linked_issues.append(issue_url)
+    q = f"repo:{repo_name}+is:pr+is:merged+linked:issue"
+    if since:
+        q += f"+updated:>{since}"
+        pages = None
+    url = f"https://api.github.com/search/issues?q={q}&sort=updated&order=desc"
+    for page, items in paginate(url, per_page=per_page, max_pages=pages, items_key="items", strict=True):
+        fetched = 0
+        for item in items:
+            if linking == "body" and not get_issues_from_pr(item, repo_name):
+                continue
+            response = make_request(item["pull_request"]["url"])
+            if not response:
+                raise FetchError(f"failed to fetch {item['pull_request']['url']}")
+            prs.append(response.json())
+            fetched += 1
+        print(f"  Page {page}: {len(items)} linked PRs, {fetched} fetched")
     
-    return linked_issues
+    print(f"Found total of {len(prs)} linked PRs for {repo_name}")
+    return prs
 
-def populate_db_from_prs(repos):
-    conn = sqlite3.connect("fixed_issues.db")
-    cursor = conn.cursor()
-    total_added = 0
+def get_closing_events(repo_name, per_page=100, pages=10, since=None):
+    """
+    (issue url, commit sha) for every issue in the repo closed by a commit,
+    from the repo wide /issues/events stream (newest first, ETag'd like
+    everything else). since = stop once a whole page is older than it.
+    raises FetchError if a page fails
+    """
+    closes = []
+    url = f"https://api.github.com/repos/{repo_name}/issues/events"
+    for _, events in paginate(url, per_page=per_page, max_pages=pages, strict=True):
+        for event in events:
+            if event.get("event") != "closed" or not event.get("commit_id"):
+                continue
+            issue = event.get("issue") or {}
+            if issue.get("pull_request"):
+                # a PR closing itself, not an issue getting fixed
+                continue
+            closes.append((issue["html_url"], event["commit_id"]))
+        if since and events and all(event.get("created_at", "") <= since for event in events):
+            break
+    return closes
+
+def link_issues_from_events(repo_name, prs, since=None, resolve_commits=False):
+    """
+    issue -> PR links from the closed events, matched on the PR's merge commit,
+    so linking costs O(event pages) per repo instead of O(PRs) and picks up
+    issues closed from the sidebar or a commit message the body regex never sees.
+    resolve_commits looks up closing commits that aren't a listed PR's merge
+    commit with /commits/{sha}/pulls (one call each).
+    returns {pr html_url: (pr, [issue urls])}
+    """
+    by_sha = {pr["merge_commit_sha"]: pr for pr in prs if pr.get("merge_commit_sha")}
+    looked_up = {}
+    links = {}
+    for issue_url, sha in get_closing_events(repo_name, since=since):
+        pr = by_sha.get(sha)
+        if pr is None and resolve_commits:
+            if sha not in looked_up:
+                response = make_request(f"https://api.github.com/repos/{repo_name}/commits/{sha}/pulls")
+                if not response:
+                    raise FetchError(f"failed to look up the PR for {repo_name}@{sha}")
+                merged = [p for p in response.json() if p.get("merged_at")]
+                looked_up[sha] = merged[0] if merged else None
+            pr = looked_up[sha]
+        if pr is not None:
+            issues = links.setdefault(pr["html_url"], (pr, []))[1]
+            if issue_url not in issues:
+                issues.append(issue_url)
+    return links
+
+def pair_prs_with_issues(repo_name, prs, linking="body", since=None):
+    """
+    [(pr, linked issue urls)] for the PRs that link at least one issue.
+    linking: "body" = regex on the PR body, "events" = the repo's closed
+    events, "both" = union of the two
+    """
+    event_links = link_issues_from_events(repo_name, prs, since=since) if linking != "body" else {}
+    pairs = []
+    seen = set()
+    for pr in prs + [pr for pr, _ in event_links.values()]:
+        if pr["html_url"] in seen:
+            continue
+        seen.add(pr["html_url"])
+        issues = get_issues_from_pr(pr, repo_name) if linking != "events" else []
+        issues += [url for url in event_links.get(pr["html_url"], (None, []))[1] if url not in issues]
+        if issues:
+            pairs.append((pr, issues))
+    return pairs
+
+def backfill_merged_prs(repo_name, pages=None, workers=BACKFILL_WORKERS):
+    """deep history: 100 PRs a page, every page up to rel="last" (or pages) fetched in parallel"""
+    return get_merged_prs(repo_name, per_page=100, pages=pages, workers=workers)
+
+def list_prs(repo_name, discovery="pulls", pages=3, since=None, backfill=False, linking="body"):
+    """
+    merged PRs to look at: "pulls" lists every closed PR, "search" only the linked ones.
+    backfill = parallel pages, only kicks in when there's no watermark to stop at
+    """
+    if discovery == "search":
+        return get_linked_prs(repo_name, pages=pages, since=since, linking=linking)
+    if backfill and not since:
+        return backfill_merged_prs(repo_name, pages=pages)
+    return get_merged_prs(repo_name, pages=pages, since=since)
+
+# linked PRs whose files are fetched at once, per repo
+PR_WORKERS = int(os.getenv("GH_PR_WORKERS", "8"))
+
+def _scrape_repo(cursor, writer, executor, repo, pages, incremental, discovery, linking, backfill):
+    """one repo of populate_db_from_prs, the bookkeeping only gets queued once everything's in"""
+    repo_name = repo["full_name"]
+    queued_for_repo = 0
     
-    for repo in repos:
-        repo_name = repo["full_name"]
-        added_for_repo = 0
-        
-        print(f"\n processing repo: {repo_name}")
-        
-        # get repo languages once to avoid repeated API calls
-        languages = get_languages(repo_name)
-        print(f"languages used by {repo_name}: {languages}")
+    # get repo languages once to avoid repeated API calls
+    languages = get_languages(repo_name)
+    print(f"languages used by {repo_name}: {languages}")
+    
+    since = get_watermark(cursor, repo_name) if incremental else None
+    prs = list_prs(repo_name, discovery, pages=pages, since=since, backfill=backfill, linking=linking)
+    if not prs:
+        print(f"no PRs found for {repo_name}, skipping it")
+        writer.call(mark_scraped, repo)
+        return 0
         
-        prs = get_merged_prs(repo_name)
-        if not prs:
-            print(f"no PRs found for {repo_name}, skipping it")
-            continue
-            
-        print(f"processing {len(prs)} PRs for {repo_name}")
+    print(f"processing {len(prs)} PRs for {repo_name}")
+    
+    linked = pair_prs_with_issues(repo_name, prs, linking, since)
+    # fet affected files, all of them queued up now, handed back in order
+    files_per_pr = executor.map(lambda pair: get_pr_files(pair[0]["html_url"]), linked)
+    
+    for (pr, linked_issues), files in zip(linked, files_per_pr):
+        pr_url = pr["html_url"]
+        print(f"PR {pr['number']} links to {len(linked_issues)} issues")
         
-        for pr in prs:
-            pr_url = pr["html_url"]
-            linked_issues = get_issues_from_pr(pr, repo_name)
-            
-            if linked_issues:
-                print(f"PR {pr['number']} links to {len(linked_issues)} issues")
-                
-                # get before/after code URLs
-                base_sha = pr.get("base", {}).get("sha")
-                head_sha = pr.get("head", {}).get("sha")
-                before_code_url = f"https://github.com/{repo_name}/commit/{base_sha}" if base_sha else None
-                after_code_url = f"https://github.com/{repo_name}/commit/{head_sha}" if head_sha else None
-                
-                # fet affected files
-                affected_files = get_affected_files(pr_url)
-                
-                # save each linked issue
-                for issue_url in linked_issues:
-                    try:
-                        cursor.execute(
-                            """
-                            INSERT OR IGNORE INTO fixed_issues VALUES (?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (issue_url, repo_name, pr_url, languages, before_code_url, after_code_url, affected_files),
-                        )
-                        if cursor.rowcount > 0:
-                            added_for_repo += 1
-                            total_added += 1
-                    except sqlite3.Error as e:
-                        print(f".db error: {e} for issue {issue_url}")
-                
-            # commit periodically to avoid losing progress on failure
-            if added_for_repo > 0 and added_for_repo % 10 == 0:
-                conn.commit()
-                print(f"Committed {added_for_repo} entries for {repo_name}")
-            
-            # baked-in delay to avoid hitting rate limits too quickly
-            time.sleep(0.5)
+        affected_files = json.dumps([file["filename"] for file in files])
         
-        # final commit for this repo
-        conn.commit()
-        print(f"{added_for_repo} entries for {repo_name} added")
+        # save each linked issue, the writer commits in batches
+        rows = fixed_issue_rows(pr, repo_name, linked_issues, languages, affected_files)
+        writer.executemany(FIXED_ISSUES_INSERT, rows, label="fixed_issues")
+        writer.executemany(PR_FILES_INSERT, pr_file_rows(pr_url, files))
+        queued_for_repo += len(rows)
     
-    conn.close()
-    return total_added
+    # queued after the rows, so it's never committed before them
+    writer.call(mark_scraped, repo)
+    writer.call(set_watermark, repo_name, prs)
+    print(f"{queued_for_repo} entries for {repo_name} queued")
+    return queued_for_repo
 
-def check_db():
-    """Check database contents and print summary stats"""
-    conn = sqlite3.connect("fixed_issues.db")
-    cursor = conn.cursor()
-    
-    # get total count
-    cursor.execute("SELECT COUNT(*) FROM fixed_issues")
-    count = cursor.fetchone()[0]
-    print(f"\n .db contains {count} total entries")
-    
-    if count > 0:
-        # repos with most entries, figure more is better than less
-        cursor.execute("""
-            SELECT repo_name, COUNT(*) as count 
-            FROM fixed_issues 
-            GROUP BY repo_name 
-            ORDER BY count DESC 
-            LIMIT 5
-        """)
-        print("\ntop repos (by entries):")
-        for repo, entries in cursor.fetchall():
-            print(f"  {repo}: {entries} entries")
-        
-        # sample entries for terminal
-        cursor.execute("SELECT * FROM fixed_issues LIMIT 3")
-        print("\nSample entries:")
-        for row in cursor.fetchall():
-            print(f"  Issue: {row[0]}")
-            print(f"  Repo: {row[1]}")
-            print(f"  PR: {row[2]}")
-            print(f"  Languages: {row[3]}")
-            print(f"  Files: {row[6]}")
-            print()
+def populate_db_from_prs(
+    repos,
+    skip_unchanged=True,
+    pages=3,
+    incremental=True,
+    discovery="pulls",
+    linking="body",
+    backfill=False,
+    pr_workers=PR_WORKERS,
+):
+    """
+    pages caps the first run of a repo, after that it's listed back to its watermark whatever pages says.
+    pages=None, backfill=True lists every merged PR a repo has (first run only, the watermark takes over after).
+    the files lookups for a repo's linked PRs go out on pr_workers threads, the
+    rows go to a DbWriter in PR order so sqlite only sees one writer
+    """
+    conn = connect()
+    cursor = conn.cursor()  # reads only, every write goes through the writer
+    writer = DbWriter(DB_PATH)
+    executor = ThreadPoolExecutor(max_workers=pr_workers, thread_name_prefix="pr-files")
     
-    conn.close()
+    try:
+        for repo in repos:
+            if not should_scrape(cursor, repo, skip_unchanged, writer):
+                continue
+            
+            print(f"\n processing repo: {repo['full_name']}")
+            try:
+                _scrape_repo(cursor, writer, executor, repo, pages, incremental, discovery, linking, backfill)
+            except FetchError as e:
+                # not marked scraped and the watermark stays put, so it's all redone next run
+                print(f"{e}, leaving {repo['full_name']} for the next run")
+    finally:
+        # Ctrl-C included, whatever's queued still gets written and committed
+        executor.shutdown(cancel_futures=True)
+        conn.close()
+        writer.close()
+    return writer.changed.get("fixed_issues", 0)
+
+def print_request_stats():
+    """connection reuse and per token usage for the run so far"""
+    stats = http_stats()
+    print(f"\n {stats['requests']} requests over {stats['connections']} connections")
+    print(f" {FLIGHTS.stats()['coalesced']} calls shared an in-flight request")
+    if ETAG_CACHE:
+        cache = ETAG_CACHE.stats()
+        print(f" {cache['not_modified']} answered by 304 (free), {cache['changed']} revalidated with new content, {cache['evicted']} evicted, {cache['bytes'] / 1e6:.1f}MB on disk")
+    if RESPONSE_CACHE:
+        cache = RESPONSE_CACHE.stats()
+        print(f" response cache: {cache['hits']} hits, {cache['misses']} misses, {cache['evicted']} evicted, {cache['bytes'] / 1e6:.1f}MB on disk")
+    retries = RETRY.stats()
+    print(f" {retries['retries']} retries, gave up on {retries['gave_up']} requests")
+    if HEDGER:
+        hedges = HEDGER.stats()
+        print(f" {hedges['hedged']} hedged requests, {hedges['hedge_won']} won by the duplicate")
+    for usage in TOKEN_POOL.stats():
+        print(f"  {usage['token']}: {usage['requests']} requests, rate limited {usage['rate_limited']}x, remaining {usage['remaining']}")
 
 if __name__ == "__main__":
     print("starting...")
@@ -256,16 +742,14 @@ if __name__ == "__main__":
     create_db()
     
     # testing numbers, can max out later
-    repos = get_mit_repos(query="stars:>50000", per_page=100, pages=10)
-    print(f"\n {len(repos)} MIT repos found")
-    
-    if repos:
-        count = populate_db_from_prs(repos)
-        print(f"\n {count} issue-PR pairs added to .db")
-    else:
-        print("no repos found")
+    # repos get processed as their search page comes in, not after all 10 pages
+    repos = iter_mit_repos(query="stars:>50000", per_page=100, pages=10)
+    count = populate_db_from_prs(repos)
+    print(f"\n {count} issue-PR pairs added to .db")
     
     # .db contents verification
     check_db()
     
+    print_request_stats()
+    
     print("\n done! \n")
\ No newline at end of file
@@ -0,0 +1,87 @@
+import threading
+import time
+
+# several GitHub tokens, each with its own budget. every request goes out on
+# whichever token has the most budget left for that bucket (core/search/graphql),
+# a token that gets rate limited sits out until its reset, and we only sleep when
+# every token is out. throughput goes up roughly linearly with the number of tokens
+
+
+class Token:
+    def __init__(self, value, name):
+        self.value = value
+        self.name = name
+        self.auth = f"token {value}"
+        self.requests = 0
+        self.rate_limited = 0
+        # per bucket: remaining, reset and the time it's retired until
+        self.remaining = {}
+        self.reset = {}
+        self.retired_until = {}
+
+    def budget(self, resource, now):
+        if self.retired_until.get(resource, 0) > now:
+            return -1
+        if resource in self.reset and now >= self.reset[resource]:
+            # window rolled over, assume it's full again until told otherwise
+            self.remaining.pop(resource, None)
+        return self.remaining.get(resource, float("inf"))
+
+    def available_at(self, resource, now):
+        """when this token can next take a request on this bucket"""
+        if self.retired_until.get(resource, 0) > now:
+            return self.retired_until[resource]
+        if self.remaining.get(resource) == 0:
+            return self.reset.get(resource, now)
+        return now
+
+
+class TokenPool:
+    def __init__(self, tokens):
+        if not tokens:
+            raise ValueError("gh token is missing")
+        self.tokens = [Token(t, f"token{i + 1} (...{t[-4:]})") for i, t in enumerate(tokens)]
+        self.lock = threading.Lock()
+
+    def acquire(self, resource):
+        """pick the token with the most budget left, sleeps if they're all rate limited"""
+        while True:
+            now = time.time()
+            with self.lock:
+                best = max(self.tokens, key=lambda t: t.budget(resource, now))
+                if best.budget(resource, now) > 0:
+                    best.requests += 1
+                    if best.remaining.get(resource):
+                        # count it now so concurrent callers spread over the tokens
+                        best.remaining[resource] -= 1
+                    return best
+                wake = min(t.available_at(resource, now) for t in self.tokens)
+            sleep_time = max(0.1, wake - now)
+            print(f"all {len(self.tokens)} tokens rate limited. sleepytime for {sleep_time:.2f} seconds...")
+            time.sleep(sleep_time)
+
+    def update(self, token, resource, headers):
+        if "X-RateLimit-Remaining" not in headers or "X-RateLimit-Reset" not in headers:
+            return
+        with self.lock:
+            token.remaining[resource] = int(headers["X-RateLimit-Remaining"])
+            token.reset[resource] = int(headers["X-RateLimit-Reset"])
+
+    def retire(self, token, resource, until):
+        """take a token out of rotation for this bucket until its reset"""
+        with self.lock:
+            token.rate_limited += 1
+            token.retired_until[resource] = until
+        print(f"{token.name} rate limited ({resource}), retired until {time.strftime('%H:%M:%S', time.localtime(until))}")
+
+    def stats(self):
+        with self.lock:
+            return [
+                {
+                    "token": t.name,
+                    "requests": t.requests,
+                    "rate_limited": t.rate_limited,
+                    "remaining": dict(t.remaining),
+                }
+                for t in self.tokens
+            ]